@@ -1,15 +1,239 @@
+import os
+import sys
+import zlib
+import base64
+import hashlib
+import mmap
+import time
+import threading
+import collections
 import logging
+import functools
+import multiprocessing
+import concurrent.futures
 import boto3
+from botocore.awsrequest import AWSConnection
+from botocore.config import Config
 from botocore.exceptions import ClientError
+from boto3.exceptions import S3UploadFailedError
 from boto3.s3.transfer import TransferConfig
+from botocore.compat import HAS_CRT
+from s3transfer.constants import FULL_OBJECT_CHECKSUM_ARGS
 import json
+
+# orjson serialises much faster than json when it is installed
+try:
+    import orjson    # To install: pip install orjson
+    _json_dumps = lambda obj: orjson.dumps(obj).decode()
+except ImportError:
+    _json_dumps = json.dumps
+
+# zstandard is only needed for uploads with compression='zstd'
+try:
+    import zstandard    # To install: pip install zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# https://docs.python.org/3/library/http.client.html#http.client.HTTPConnection
+# Request bodies are sent in blocksize writes (128 KiB as configured by botocore,
+# 8 KiB on older urllib3), which makes upload threads fight over the GIL, so send
+# at least 1 MiB at a time. botocore passes blocksize explicitly, so it is raised
+# rather than defaulted.
+def _patch_http_blocksize(blocksize=1024 * 1024):
+    # Always wrap botocore's own __init__, so reloading this module never stacks wrappers
+    connection_init = getattr(AWSConnection, '_unpatched_init', AWSConnection.__init__)
+
+    def __init__(self, *args, **kwargs):
+        kwargs['blocksize'] = max(kwargs.get('blocksize') or 0, blocksize)
+        connection_init(self, *args, **kwargs)
+
+    AWSConnection._unpatched_init = connection_init
+    AWSConnection.__init__ = __init__
+
+_patch_http_blocksize()
+
+# https://boto3.amazonaws.com/v1/documentation/api/latest/guide/session.html
+# Sessions cache resolved credentials and loaded service models, so share one per
+# set of credentials. Sessions are not thread-safe, so clients are built under a lock.
+_session_lock = threading.Lock()
+
+@functools.lru_cache(maxsize=None)
+def _get_session(aws_access_key_id=None, aws_secret_access_key=None):
+    return boto3.session.Session(aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key)
+
+# Keep idle connections alive and back off adaptively when S3 throttles
+def _botocore_config(max_pool_connections):
+    return Config(max_pool_connections=max_pool_connections, tcp_keepalive=True, retries={'mode': 'adaptive', 'max_attempts': 10})
+
+# https://boto3.amazonaws.com/v1/documentation/api/latest/guide/clients.html
+# Clients are thread-safe and expensive to build, so share one per configuration
+@functools.lru_cache(maxsize=None)
+def _get_s3_client(aws_access_key_id=None, aws_secret_access_key=None, region_name=None, endpoint_url=None, max_pool_connections=10):
+    botocore_config = _botocore_config(max_pool_connections)
+    with _session_lock:
+        session = _get_session(aws_access_key_id, aws_secret_access_key)
+        return session.client('s3', region_name=region_name, endpoint_url=endpoint_url, config=botocore_config)
+
+# https://boto3.amazonaws.com/v1/documentation/api/latest/guide/s3.html
+# Default transfer config, shared by every instance: 64 MiB parts with 20 threads
+# so that large transfers are bound by the network, not part overhead
+_DEFAULT_TRANSFER_CONFIG = TransferConfig(multipart_threshold=64 * 1024 * 1024, multipart_chunksize=64 * 1024 * 1024, max_concurrency=20, io_chunksize=1024 * 1024, use_threads=True)
+
+# Configs are shared between callers with the same settings, so treat them as read-only
+@functools.lru_cache(maxsize=64)
+def _build_transfer_config(multipart_threshold, max_concurrency, use_threads, multipart_chunksize, io_chunksize):
+    return TransferConfig(multipart_threshold=multipart_threshold, max_concurrency=max_concurrency, use_threads=use_threads, multipart_chunksize=multipart_chunksize, io_chunksize=io_chunksize)
+
+# Check the installed awscrt without boto3's internal helpers, which may change between releases
+def _has_crt_version(minimum_version):
+    if not HAS_CRT:
+        return False
+    import awscrt
+    try:
+        return tuple(int(part) for part in awscrt.__version__.split('.')) >= minimum_version
+    except (AttributeError, ValueError):
+        return False
+
+# boto3 only hands a transfer to the CRT client when every other option is left unset
+@functools.lru_cache(maxsize=64)
+def _build_crt_transfer_config(multipart_threshold, max_concurrency, multipart_chunksize):
+    return TransferConfig(multipart_threshold=multipart_threshold, max_concurrency=max_concurrency, multipart_chunksize=multipart_chunksize, preferred_transfer_client='crt')
+
+# https://boto3.amazonaws.com/v1/documentation/api/latest/guide/s3-presigned-urls.html
+# Signing is pure CPU and gives the same result for the same input, so reuse a
+# result for a short while. A result is served for at most a minute, or half its
+# expiration, so callers always get most of the validity they asked for.
+class _PresignCache():
+    def __init__(self, maxsize=4096, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, expiration, sign):
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now < entry[0]:
+                self.entries.move_to_end(key)
+                return entry[1]
+
+        value = sign()
+        with self.lock:
+            self.entries[key] = (now + min(self.ttl, expiration / 2), value)
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+def _presign_key(*parts):
+    # Parameters and policy conditions are dicts and lists, so key on their JSON form
+    try:
+        return tuple(json.dumps(part, sort_keys=True) if isinstance(part, (dict, list)) else part for part in parts)
+    except TypeError:
+        return None
+
+_presign_cache = _PresignCache()
+
+# Read-only file-like that gzips another file-like as it is read
+class _GzipReader():
+    def __init__(self, fileobj, level=6):
+        self.fileobj = fileobj
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+        self.buffer = bytearray()
+        self.eof = False
+
+    def read(self, size=-1):
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            chunk = self.fileobj.read(1024 * 1024)
+            if chunk:
+                self.buffer += self.compressor.compress(chunk)
+            else:
+                self.buffer += self.compressor.flush()
+                self.eof = True
+        if size < 0:
+            size = len(self.buffer)
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+# Largest object S3 accepts in a single PUT
+_MAX_PUT_OBJECT_SIZE = 5 * 1024 * 1024 * 1024
+
+# extra_args that carry a checksum computed by the caller over the file contents
+_PRECOMPUTED_CHECKSUM_ARGS = tuple(FULL_OBJECT_CHECKSUM_ARGS)
+
+# Only the CRC checksums can be sent for a whole object uploaded in parts, the others need a single PUT
+_SINGLE_PUT_CHECKSUM_ARGS = tuple(key for key in _PRECOMPUTED_CHECKSUM_ARGS if not key.startswith('ChecksumCRC'))
+
+# Base64 SHA-256 of a file, read in large blocks; hashlib uses OpenSSL, which picks
+# the CPU's SHA instructions (SHA-NI, ARMv8 crypto) when they are available
+def _sha256_file(file_name, bufsize=4 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(file_name, 'rb') as f:
+        for block in iter(lambda: f.read(bufsize), b''):
+            digest.update(block)
+    return base64.b64encode(digest.digest()).decode()
+
+# File-like wrapper that hands every downloaded chunk to a callable
+class _CallableWriter():
+    def __init__(self, write):
+        self.write = write
+
+# Per-process client used by upload_file_mp workers. A forked worker inherits the
+# parent's cached sessions and clients, which must not cross a fork, so build a new one
+_worker_client = None
+
+def _init_upload_worker(aws_access_key_id, aws_secret_access_key, region_name, endpoint_url):
+    global _worker_client
+    session = boto3.session.Session(aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key, region_name=region_name)
+    _worker_client = session.client('s3', endpoint_url=endpoint_url, config=_botocore_config(10))
+
+def _upload_part(task):
+    file_name, bucket, object_name, upload_id, part_number, offset, length = task
+    with open(file_name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        response = _worker_client.upload_part(Bucket=bucket, Key=object_name, UploadId=upload_id, PartNumber=part_number, Body=mm[offset:offset + length])
+    return {'ETag': response['ETag'], 'PartNumber': part_number}
+
 class AmazonS3():
-    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None, region_name=None, config=TransferConfig(), endpoint_url=None):
+    # Transfer configs picked by upload_file from the file size, built once at import.
+    # _CFG_SMALL is also the per-file config of upload_files on default instances
+    _CFG_SMALL = TransferConfig(multipart_threshold=64 * 1024 * 1024, multipart_chunksize=64 * 1024 * 1024, io_chunksize=1024 * 1024, use_threads=False)
+    _CFG_MEDIUM = TransferConfig(multipart_threshold=16 * 1024 * 1024, multipart_chunksize=16 * 1024 * 1024, max_concurrency=10, io_chunksize=1024 * 1024, use_threads=True)
+    _CFG_LARGE = _DEFAULT_TRANSFER_CONFIG
+
+    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None, region_name=None, config=None, endpoint_url=None, crt=False):
         self.aws_access_key_id = aws_access_key_id
         self.aws_secret_access_key = aws_secret_access_key
         self.region_name = region_name
+        self.endpoint_url = endpoint_url
+
+        # If S3 config was not specified, use the shared tuned default
+        self.tune_by_size = config is None
+        if config is None:
+            config = _DEFAULT_TRANSFER_CONFIG
         self.config = config
-        self.s3_client = boto3.client('s3', aws_access_key_id=aws_access_key_id, aws_secret_access_key=aws_secret_access_key, region_name=region_name, endpoint_url=endpoint_url)
+
+        # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/s3.html
+        # Hand transfers to the AWS Common Runtime client when a recent enough awscrt is installed
+        self.crt = crt and _has_crt_version((0, 19, 18))
+        if crt and not self.crt:
+            logger.warning('awscrt 0.19.18 or later is not installed, using the default transfer client')
+        elif crt:
+            self.tune_by_size = False
+            self.config = _build_crt_transfer_config(config.multipart_threshold, config.max_request_concurrency, config.multipart_chunksize)
+
+        # Size the connection pool so that every transfer thread gets its own connection,
+        # with headroom for batch methods that run several transfers at once. The floor
+        # of 64 covers the 32 threads put_transfer_config allows, so the client is never rebuilt
+        self.max_pool_connections = max(64, 2 * self.config.max_request_concurrency)
+
+    # The client is built on first use, so helpers like extra_metadata stay cheap
+    @functools.cached_property
+    def s3_client(self):
+        return _get_s3_client(self.aws_access_key_id, self.aws_secret_access_key, self.region_name, self.endpoint_url, self.max_pool_connections)
     
     # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/s3-example-creating-buckets.html
     def create_bucket(self, bucket_name):
@@ -32,27 +256,44 @@ class AmazonS3():
                 self.s3_client.create_bucket(Bucket=bucket_name,
                                         CreateBucketConfiguration=location)
         except ClientError as e:
-            logging.error(e)
+            logger.error('S3 request failed: %s', e)
             return False
         return True
     
-    def list_buckets(self):
+    def list_buckets(self, verbose=False):
         # Retrieve the list of existing buckets
         response = self.s3_client.list_buckets()
 
-        # Output the bucket names
-        print('Existing buckets:')
-        for bucket in response['Buckets']:
-            print(f'  {bucket["Name"]}')
+        # Output the bucket names in a single write when asked to
+        if verbose:
+            names = [bucket['Name'] for bucket in response['Buckets']]
+            sys.stdout.write('Existing buckets:\n' + ''.join(f'  {name}\n' for name in names))
         return response['Buckets']
+
+    # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/paginators.html
+    def iter_objects(self, bucket, prefix=None, chunk=1000):
+        """Iterate over the object names in an S3 bucket
+
+        Pages are fetched lazily, so large buckets are never held in memory.
+
+        :param bucket: Bucket to list
+        :param prefix: Only list object names that start with this prefix
+        :param chunk: Number of object names fetched per request, at most 1000
+        :return: Generator of object names
+        """
+
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix or '', PaginationConfig={'PageSize': chunk}):
+            yield from (obj['Key'] for obj in page.get('Contents', ()))
         
     # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/s3-uploading-files.html
-    def upload_file(self, file_name, bucket, object_name=None, extra_args=None, callback=None, config=None):
+    def upload_file(self, file_name, bucket, object_name=None, extra_args=None, callback=None, config=None, compression=None):
         """Upload a file to an S3 bucket
 
         :param file_name: File to upload
         :param bucket: Bucket to upload to
         :param object_name: S3 object name. If not specified then file_name is used
+        :param compression: 'gzip' or 'zstd' to compress the file while uploading
         :return: True if file was uploaded, else False
         """
 
@@ -60,14 +301,46 @@ class AmazonS3():
         if object_name is None:
             object_name = file_name
 
-        # If S3 config was not specified, use self transfer config
-        if config is None:
+        # Compress on the fly and store the object with the matching ContentEncoding
+        if compression is not None:
+            if compression not in ('gzip', 'zstd'):
+                logger.error('Unsupported compression %r for %s, use gzip or zstd', compression, file_name)
+                return False
+            if compression == 'zstd' and zstandard is None:
+                logger.error('zstandard is not installed, cannot upload %s with zstd compression', file_name)
+                return False
+            # A checksum of the uncompressed file can never match the compressed object
+            if any(key in _PRECOMPUTED_CHECKSUM_ARGS for key in (extra_args or {})):
+                logger.error('Cannot upload %s compressed with a checksum of the uncompressed file', file_name)
+                return False
+            extra_args = dict(extra_args or {}, ContentEncoding=compression)
+            with open(file_name, 'rb') as f:
+                if compression == 'gzip':
+                    reader = _GzipReader(f)
+                elif compression == 'zstd':
+                    reader = zstandard.ZstdCompressor(level=3).stream_reader(f)
+                return self.upload_fileobj(reader, bucket, object_name, extra_args=extra_args, callback=callback, config=config)
+
+        # If S3 config was not specified, pick one by file size or use self transfer config
+        size = os.path.getsize(file_name)
+        if config is None and self.tune_by_size:
+            config = self._transfer_config_for_size(size)
+        elif config is None:
             config = self.config
 
+        if not self._can_put_checksum(size, extra_args, file_name):
+            return False
+
         try:
-            response = self.s3_client.upload_file(file_name, bucket, object_name, ExtraArgs=extra_args, Callback=callback, Config=config)
-        except ClientError as e:
-            logging.error(e)
+            if self._use_put_object(size, callback, config, extra_args):
+                with open(file_name, 'rb') as f:
+                    self.s3_client.put_object(Bucket=bucket, Key=object_name, Body=f, **(extra_args or {}))
+                if callback is not None:
+                    callback(size)
+            else:
+                response = self.s3_client.upload_file(file_name, bucket, object_name, ExtraArgs=extra_args, Callback=callback, Config=config)
+        except (ClientError, S3UploadFailedError) as e:
+            logger.error('S3 request failed: %s', e)
             return False
         return True
 
@@ -84,26 +357,203 @@ class AmazonS3():
         if config is None:
             config = self.config
 
+        # Only the size of a seekable stream is known up front. mmap has no seekable()
+        # before Python 3.13, so fall back to checking for seek
+        size = None
+        if fileobj.seekable() if hasattr(fileobj, 'seekable') else hasattr(fileobj, 'seek'):
+            position = fileobj.tell()
+            fileobj.seek(0, 2)
+            size = fileobj.tell() - position
+            fileobj.seek(position)
+
+        if not self._can_put_checksum(size, extra_args, object_name):
+            return False
+
         try:
-            response = self.s3_client.upload_fileobj(fileobj, bucket, object_name, ExtraArgs=extra_args, Callback=callback, Config=config)
-        except ClientError as e:
-            logging.error(e)
+            if size is not None and self._use_put_object(size, callback, config, extra_args):
+                self.s3_client.put_object(Bucket=bucket, Key=object_name, Body=fileobj, **(extra_args or {}))
+                if callback is not None:
+                    callback(size)
+            else:
+                response = self.s3_client.upload_fileobj(fileobj, bucket, object_name, ExtraArgs=extra_args, Callback=callback, Config=config)
+        except (ClientError, S3UploadFailedError) as e:
+            logger.error('S3 request failed: %s', e)
             return False
         return True
     
-    def extra_metadata(self, metadata, args={}):
+    def upload_file_mmap(self, file_name, bucket, object_name=None, extra_args=None, callback=None, config=None):
+        """Upload a file to an S3 bucket from a memory map of the file
+
+        Parts are sliced straight out of the page cache instead of going
+        through buffered file reads.
+
+        :param file_name: File to upload
+        :param bucket: Bucket to upload to
+        :param object_name: S3 object name. If not specified then file_name is used
+        :return: True if file was uploaded, else False
+        """
+
+        # If S3 object_name was not specified, use file_name
+        if object_name is None:
+            object_name = file_name
+
+        # An empty file cannot be memory mapped
+        if os.path.getsize(file_name) == 0:
+            return self.upload_file(file_name, bucket, object_name, extra_args=extra_args, callback=callback, config=config)
+
+        # mmap objects are seekable file-likes, so they can be handed to upload_fileobj.
+        # Parts are read front to back, so ask the kernel for aggressive readahead (POSIX only)
+        with open(file_name, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            return self.upload_fileobj(mm, bucket, object_name, extra_args=extra_args, callback=callback, config=config)
+
+    def upload_file_mp(self, file_name, bucket, object_name=None, part_size=64 * 1024 * 1024, workers=8):
+        """Upload a file to an S3 bucket with a pool of worker processes
+
+        Every part is sent by a separate process with its own client, so
+        hashing and TLS work is not limited by a single interpreter lock.
+
+        :param file_name: File to upload
+        :param bucket: Bucket to upload to
+        :param object_name: S3 object name. If not specified then file_name is used
+        :param part_size: Size of each part in bytes, at least 5 MiB
+        :param workers: Number of worker processes
+        :return: True if file was uploaded, else False
+        """
+
+        # If S3 object_name was not specified, use file_name
+        if object_name is None:
+            object_name = file_name
+
+        # A single part gains nothing from extra processes
+        size = os.path.getsize(file_name)
+        if size <= part_size:
+            return self.upload_file(file_name, bucket, object_name)
+
+        try:
+            upload_id = self.s3_client.create_multipart_upload(Bucket=bucket, Key=object_name)['UploadId']
+        except ClientError as e:
+            logger.error('S3 request failed: %s', e)
+            return False
+
+        tasks = [(file_name, bucket, object_name, upload_id, part_number, offset, min(part_size, size - offset))
+                 for part_number, offset in enumerate(range(0, size, part_size), start=1)]
+        # Use the platform's default start method, so scripts without a main guard keep working
+        initargs = (self.aws_access_key_id, self.aws_secret_access_key, self.region_name, self.endpoint_url)
+        completed = False
+        try:
+            with multiprocessing.Pool(processes=min(workers, len(tasks)), initializer=_init_upload_worker, initargs=initargs) as pool:
+                parts = pool.map(_upload_part, tasks)
+            self.s3_client.complete_multipart_upload(Bucket=bucket, Key=object_name, UploadId=upload_id, MultipartUpload={'Parts': parts})
+            completed = True
+        except (ClientError, S3UploadFailedError) as e:
+            logger.error('S3 request failed: %s', e)
+            return False
+        finally:
+            # Abort on any failure, including connection errors and interrupts,
+            # so that no unfinished upload keeps its parts billed
+            if not completed:
+                try:
+                    self.s3_client.abort_multipart_upload(Bucket=bucket, Key=object_name, UploadId=upload_id)
+                except ClientError as e:
+                    logger.error('S3 request failed: %s', e)
+        return True
+
+    def upload_files(self, items, max_workers=32, extra_args=None):
+        """Upload many files to S3 in parallel
+
+        Each file is uploaded on its own worker thread with a single-threaded
+        transfer config, so a batch does not spawn a thread pool per file.
+
+        :param items: Iterable of (file_name, bucket[, object_name[, extra_args]]) tuples
+        :param max_workers: Number of files to upload at the same time
+        :param extra_args: extra_args for items that do not give their own
+        :return: List of upload results (True/False) in the order of items
+        """
+
+        # Keep the instance part sizes but transfer each file on its worker thread.
+        # The CRT client schedules its own requests, so only keep it on the CRT
+        if self.crt:
+            config = _build_crt_transfer_config(self.config.multipart_threshold, self.config.max_request_concurrency, self.config.multipart_chunksize)
+        elif self.tune_by_size:
+            config = self._CFG_SMALL
+        else:
+            config = self.get_transfer_config(multipart_threshold=self.config.multipart_threshold, multipart_chunksize=self.config.multipart_chunksize, io_chunksize=self.config.io_chunksize, use_threads=False)
+
+        # Fill in the optional object_name and extra_args of each item
+        uploads = []
+        for item in items:
+            file_name, bucket, object_name, item_extra_args = (tuple(item) + (None, None))[:4]
+            uploads.append((file_name, bucket, object_name, extra_args if item_extra_args is None else item_extra_args))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.upload_file, file_name, bucket, object_name, extra_args=item_extra_args, config=config) for (file_name, bucket, object_name, item_extra_args) in uploads]
+
+        # One failed file must not hide the results of the others
+        results = []
+        for future in futures:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error('S3 upload failed: %s', e)
+                results.append(False)
+        return results
+
+    def extra_metadata(self, metadata, args=None):
+        args = {} if args is None else args
         args['Metadata'] = metadata
         return args
 
-    def extra_public_read(self, args={}):
+    def extra_public_read(self, args=None):
+        args = {} if args is None else args
         args['ACL'] = 'public-read'
         return args
     
-    def extra_grant(self, grant_read, grant_full_control, args={}):
+    def extra_grant(self, grant_read, grant_full_control, args=None):
+        args = {} if args is None else args
         args['GrantRead'] = grant_read
         args['GrantFullControl'] = grant_full_control
         return args
 
+    def extra_checksum_sha256(self, file_name, args=None):
+        """Add the SHA-256 checksum of a file to the extra_args of its upload
+
+        S3 verifies the upload against it and botocore does not read the file
+        a second time to compute its own checksum. S3 only accepts it for an
+        object sent in a single request, so upload_file sends such uploads
+        with put_object whatever their size, up to the 5 GiB limit of a PUT.
+
+        :param file_name: File that will be uploaded
+        :param args: Dictionary of extra_args to add the checksum to
+        :return: Dictionary of extra_args
+        """
+
+        args = {} if args is None else args
+        args['ChecksumSHA256'] = _sha256_file(file_name)
+        return args
+
+    def build_extra_args(self, *, metadata=None, acl=None, grant_read=None, grant_full_control=None):
+        """Build the extra_args of an upload in a single dict
+
+        :param metadata: Dictionary of user metadata
+        :param acl: Canned ACL, e.g., 'public-read'
+        :param grant_read: Grantees of read access
+        :param grant_full_control: Grantees of full control
+        :return: Dictionary with only the arguments that were given
+        """
+
+        args = {}
+        if metadata is not None:
+            args['Metadata'] = metadata
+        if acl is not None:
+            args['ACL'] = acl
+        if grant_read is not None:
+            args['GrantRead'] = grant_read
+        if grant_full_control is not None:
+            args['GrantFullControl'] = grant_full_control
+        return args
+
     # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/s3-example-download-file.html
     def download_file(self, bucket, object_name, file_name=None, config=None):
         # If S3 object_name was not specified, use file_name
@@ -116,20 +566,221 @@ class AmazonS3():
 
         return self.s3_client.download_file(bucket, object_name, file_name, Config=config)
 
+    def download_file_aligned(self, bucket, object_name, file_name=None):
+        """Download an S3 object with ranged GETs that match its upload parts
+
+        :param bucket: Bucket to download from
+        :param object_name: S3 object name
+        :param file_name: File to download to. If not specified then object_name is used
+        """
+
+        # Objects uploaded in one request have no parts to align to
+        response = self.s3_client.head_object(Bucket=bucket, Key=object_name, PartNumber=1)
+        if response.get('PartsCount', 1) <= 1:
+            return self.download_file(bucket, object_name, file_name)
+
+        part_size = response['ContentLength']
+        if self.crt:
+            config = _build_crt_transfer_config(part_size, self.config.max_request_concurrency, part_size)
+            return self.download_file(bucket, object_name, file_name, config=config)
+        config = self.get_transfer_config(multipart_threshold=part_size, max_concurrency=self.config.max_request_concurrency, use_threads=self.config.use_threads, multipart_chunksize=part_size, io_chunksize=self.config.io_chunksize)
+        return self.download_file(bucket, object_name, file_name, config=config)
+
+    def download_file_ranged(self, bucket, object_name, file_name=None, part_size=32 * 1024 * 1024, concurrency=32):
+        """Download an S3 object with parallel ranged GETs written in place
+
+        The file is allocated up front and every range is written at its own
+        offset, so workers never wait on each other or on a shared file position.
+        Needs os.pwrite, which is only available on POSIX systems.
+
+        :param bucket: Bucket to download from
+        :param object_name: S3 object name
+        :param file_name: File to download to. If not specified then object_name is used
+        :param part_size: Size of each ranged GET in bytes
+        :param concurrency: Number of ranged GETs in flight
+        """
+
+        # If S3 file_name was not specified, use object_name
+        if file_name is None:
+            file_name = object_name
+
+        # Pin the ETag so every range comes from the same version of the object
+        response = self.s3_client.head_object(Bucket=bucket, Key=object_name)
+        size = response['ContentLength']
+        etag = response['ETag']
+
+        def download_range(offset):
+            end = min(offset + part_size, size) - 1
+            response = self.s3_client.get_object(Bucket=bucket, Key=object_name, Range=f'bytes={offset}-{end}', IfMatch=etag)
+            for chunk in response['Body'].iter_chunks(self.config.io_chunksize):
+                # pwrite may write less than it was given, so write until the chunk is done
+                view = memoryview(chunk)
+                while view:
+                    written = os.pwrite(fd, view, offset)
+                    view = view[written:]
+                    offset += written
+
+        # Download to a temporary name and only move it into place once every range
+        # arrived, so a failed download never leaves a full-size file behind
+        temp_name = f'{file_name}.{os.urandom(4).hex()}'
+        fd = os.open(temp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            try:
+                if size and hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(fd, 0, size)
+                else:
+                    os.ftruncate(fd, size)
+
+                with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    for _ in executor.map(download_range, range(0, size, part_size)):
+                        pass
+            finally:
+                os.close(fd)
+            os.replace(temp_name, file_name)
+        except BaseException:
+            os.unlink(temp_name)
+            raise
+        return True
+
     def download_fileobj(self, bucket, object_name, fileobj, config=None):
         # If S3 config was not specified, use self transfer config
         if config is None:
             config = self.config
 
-        return self.s3_client.download_file(bucket, object_name, fileobj, Config=config)
+        # Stream into a plain callable, e.g. a socket's sendall, through a write() shim
+        if not hasattr(fileobj, 'write') and callable(fileobj):
+            fileobj = _CallableWriter(fileobj)
+
+        return self.s3_client.download_fileobj(bucket, object_name, fileobj, Config=config)
+
+    def download_files(self, items, max_workers=16):
+        """Download many S3 objects in parallel
+
+        Each object is downloaded on its own worker thread and still uses the
+        ranged GETs of the instance transfer config.
+
+        :param items: Iterable of (bucket, object_name, file_name) tuples
+        :param max_workers: Number of objects to download at the same time
+        :return: List of download results (True/False) in the order of items
+        """
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(self.download_file, bucket, object_name, file_name) for (bucket, object_name, file_name) in items]
+
+        # One failed object must not hide the results of the others
+        results = []
+        for future in futures:
+            try:
+                future.result()
+                results.append(True)
+            except Exception as e:
+                logger.error('S3 download failed: %s', e)
+                results.append(False)
+        return results
+
+    # https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/s3/client/copy.html
+    def copy_object(self, src_bucket, src_key, dst_bucket, dst_key, extra_args=None, config=None):
+        """Copy an S3 object to another bucket or key on the S3 side
+
+        Large objects are copied with UploadPartCopy, so the data never passes
+        through this machine.
+
+        :param src_bucket: Bucket to copy from
+        :param src_key: S3 object name to copy
+        :param dst_bucket: Bucket to copy to
+        :param dst_key: S3 object name of the copy
+        :return: True if object was copied, else False
+        """
+
+        # If S3 config was not specified, use self transfer config
+        if config is None:
+            config = self.config
+
+        copy_source = {'Bucket': src_bucket, 'Key': src_key}
+        try:
+            self.s3_client.copy(copy_source, dst_bucket, dst_key, ExtraArgs=extra_args, Config=config)
+        except ClientError as e:
+            logger.error('S3 request failed: %s', e)
+            return False
+        return True
 
     # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/s3.html
-    def put_transfer_config(self, multipart_threshold=None, max_concurrency=None, use_threads=None):
-        self.config = TransferConfig(multipart_threshold=multipart_threshold, max_concurrency=max_concurrency, use_threads=use_threads)
+    def put_transfer_config(self, multipart_threshold=64 * 1024 * 1024, max_concurrency=20, use_threads=True, multipart_chunksize=64 * 1024 * 1024, io_chunksize=1024 * 1024):
+        # More than 32 threads barely adds throughput, so cap it
+        if max_concurrency > 32:
+            logger.warning('max_concurrency %s is capped at 32', max_concurrency)
+            max_concurrency = 32
+
+        self.tune_by_size = False
+
+        # The CRT client only takes the part sizes and concurrency, use_threads and io_chunksize do not apply
+        if self.crt:
+            self.config = _build_crt_transfer_config(multipart_threshold, max_concurrency, multipart_chunksize)
+            return True
+
+        self.config = self.get_transfer_config(multipart_threshold=multipart_threshold, max_concurrency=max_concurrency, use_threads=use_threads, multipart_chunksize=multipart_chunksize, io_chunksize=io_chunksize)
         return True
     
-    def get_transfer_config(self, multipart_threshold=None, max_concurrency=None, use_threads=None):
-        return TransferConfig(multipart_threshold=multipart_threshold, max_concurrency=max_concurrency, use_threads=use_threads)
+    def get_transfer_config(self, multipart_threshold=64 * 1024 * 1024, max_concurrency=20, use_threads=True, multipart_chunksize=64 * 1024 * 1024, io_chunksize=1024 * 1024):
+        return _build_transfer_config(multipart_threshold, max_concurrency, use_threads, multipart_chunksize, io_chunksize)
+
+    def _use_put_object(self, size, callback, config, extra_args=None):
+        """Check if an upload can skip the transfer manager
+
+        Objects below the multipart threshold need a single PUT, so sending
+        them with put_object avoids the transfer manager's queue and futures.
+        Uploads with a progress callback or on the CRT client keep the
+        managed path. Uploads carrying a precomputed checksum other than a
+        CRC always use put_object, since S3 only accepts those in a single PUT.
+
+        :param size: Object size in bytes
+        :param callback: Progress callback of the upload
+        :param config: TransferConfig of the upload
+        :param extra_args: Extra arguments of the upload
+        :return: True if the object should be sent with put_object
+        """
+
+        if any(key in _SINGLE_PUT_CHECKSUM_ARGS for key in (extra_args or {})):
+            return True
+        return callback is None and size < config.multipart_threshold and config.preferred_transfer_client != 'crt'
+
+    def _can_put_checksum(self, size, extra_args, name):
+        """Check if an upload's precomputed checksum can be sent with it
+
+        Checksums other than a CRC force a single PUT, so the object size has
+        to be known and at most 5 GiB.
+
+        :param size: Object size in bytes, or None if unknown
+        :param extra_args: Extra arguments of the upload
+        :param name: File or object name for the error message
+        :return: True if the upload can go ahead, else False
+        """
+
+        if not any(key in _SINGLE_PUT_CHECKSUM_ARGS for key in (extra_args or {})):
+            return True
+        if size is None:
+            logger.error('Cannot upload %s with a precomputed checksum, its size is unknown', name)
+            return False
+        if size > _MAX_PUT_OBJECT_SIZE:
+            logger.error('Cannot upload %s with a precomputed checksum, it is larger than 5 GiB', name)
+            return False
+        return True
+
+    def _transfer_config_for_size(self, size):
+        """Pick a transfer config for an object of the given size
+
+        Small objects are sent in a single request, medium objects use 16 MiB
+        parts and large objects use 64 MiB parts with more threads.
+
+        :param size: Object size in bytes
+        :return: TransferConfig
+        """
+
+        if size < 50 * 1024 * 1024:
+            return self._CFG_SMALL
+        if size < 1024 * 1024 * 1024:
+            return self._CFG_MEDIUM
+        return self._CFG_LARGE
 
     # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/s3-presigned-urls.html
     def create_presigned_url(self, bucket_name, object_name, expiration=3600):
@@ -141,19 +792,29 @@ class AmazonS3():
         :return: Presigned URL as string. If error, returns None.
         """
 
-        # Generate a presigned URL for the S3 object
+        # Generate a presigned URL for the S3 object, or reuse a recent one
+        params = {'Bucket': bucket_name, 'Key': object_name}
+        sign = functools.partial(self.s3_client.generate_presigned_url, 'get_object', Params=params, ExpiresIn=expiration)
         try:
-            response = self.s3_client.generate_presigned_url('get_object',
-                                                        Params={'Bucket': bucket_name,
-                                                                'Key': object_name},
-                                                        ExpiresIn=expiration)
+            response = _presign_cache.get((self.s3_client, 'get_object', bucket_name, object_name, expiration), expiration, sign)
         except ClientError as e:
-            logging.error(e)
+            logger.error('S3 request failed: %s', e)
             return None
 
         # The response contains the presigned URL
         return response
 
+    def create_presigned_urls(self, items, expiration=3600):
+        """Generate presigned URLs for many S3 objects
+
+        :param items: Iterable of (bucket_name, object_name) tuples
+        :param expiration: Time in seconds for the presigned URLs to remain valid
+        :return: List of presigned URLs (None on error) in the order of items
+        """
+
+        # Signing is local CPU work, so a plain loop over the cached signer is fastest
+        return [self.create_presigned_url(bucket_name, object_name, expiration) for (bucket_name, object_name) in items]
+
     def create_presigned_url_expanded(self, client_method_name, method_parameters=None, expiration=3600, http_method=None):
         """Generate a presigned URL to invoke an S3.Client method
 
@@ -166,14 +827,16 @@ class AmazonS3():
         :return: Presigned URL as string. If error, returns None.
         """
 
-        # Generate a presigned URL for the S3 client method
+        # Generate a presigned URL for the S3 client method, or reuse a recent one
+        sign = functools.partial(self.s3_client.generate_presigned_url, ClientMethod=client_method_name,
+                                                                Params=method_parameters,
+                                                                ExpiresIn=expiration,
+                                                                HttpMethod=http_method)
+        key = _presign_key(self.s3_client, client_method_name, method_parameters, expiration, http_method)
         try:
-            response = self.s3_client.generate_presigned_url(ClientMethod=client_method_name,
-                                                        Params=method_parameters,
-                                                        ExpiresIn=expiration,
-                                                        HttpMethod=http_method)
+            response = sign() if key is None else _presign_cache.get(key, expiration, sign)
         except ClientError as e:
-            logging.error(e)
+            logger.error('S3 request failed: %s', e)
             return None
 
         # The response contains the presigned URL
@@ -193,19 +856,22 @@ class AmazonS3():
         :return: None if error.
         """
 
-        # Generate a presigned S3 POST URL
+        # Generate a presigned S3 POST URL, or reuse a recent one
+        sign = functools.partial(self.s3_client.generate_presigned_post, bucket_name,
+                                                                object_name,
+                                                                Fields=fields,
+                                                                Conditions=conditions,
+                                                                ExpiresIn=expiration)
+        key = _presign_key(self.s3_client, 'post_object', bucket_name, object_name, fields, conditions, expiration)
         try:
-            response = self.s3_client.generate_presigned_post(bucket_name,
-                                                        object_name,
-                                                        Fields=fields,
-                                                        Conditions=conditions,
-                                                        ExpiresIn=expiration)
+            response = sign() if key is None else _presign_cache.get(key, expiration, sign)
         except ClientError as e:
-            logging.error(e)
+            logger.error('S3 request failed: %s', e)
             return None
 
-        # The response contains the presigned URL and required fields
-        return response
+        # The response contains the presigned URL and required fields, copied so
+        # that callers cannot change the cached fields
+        return {'url': response['url'], 'fields': dict(response['fields'])}
 
     # https://boto3.amazonaws.com/v1/documentation/api/latest/guide/s3-example-bucket-policies.html
     def get_bucket_policy(self, bucket_name):
@@ -227,13 +893,23 @@ class AmazonS3():
         #     }]
         # }
 
-        # Convert the policy from JSON dict to string
-        bucket_policy = json.dumps(bucket_policy)
+        # Convert the policy from JSON dict to string, unless it already is one
+        if not isinstance(bucket_policy, str):
+            bucket_policy = _json_dumps(bucket_policy)
 
         # Set the new policy
         self.s3_client.put_bucket_policy(Bucket=bucket_name, Policy=bucket_policy)
         return True
 
+    def freeze_bucket_policy(self, bucket_policy):
+        # Serialise a policy once into a compact template for put_bucket_policy_template,
+        # e.g. with 'Resource': 'arn:aws:s3:::{bucket}/*'
+        return json.dumps(bucket_policy, separators=(',', ':'))
+
+    def put_bucket_policy_template(self, bucket_name, template_str):
+        # Fill the {bucket} placeholder of a frozen policy instead of serialising a dict per bucket
+        return self.put_bucket_policy(bucket_name, template_str.replace('{bucket}', bucket_name))
+
     def delete_bucket_policy(self, bucket_name):
         # Delete a bucket's policy
         self.s3_client.delete_bucket_policy(Bucket=bucket_name)
@@ -281,7 +957,7 @@ class AmazonS3():
                 return []
             else:
                 # AllAccessDisabled error == bucket not found
-                logging.error(e)
+                logger.error('S3 request failed: %s', e)
                 return None
         return response['CORSRules']
 
@@ -0,0 +1,98 @@
+import asyncio
+import logging
+from aiobotocore.config import AioConfig    # To install: pip install aiobotocore
+from aiobotocore.session import get_session
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger(__name__)
+
+# https://aiobotocore.aio-libs.org/en/latest/tutorial.html
+class AsyncAmazonS3():
+    def __init__(self, aws_access_key_id=None, aws_secret_access_key=None, region_name=None, endpoint_url=None, max_concurrency=64):
+        self.aws_access_key_id = aws_access_key_id
+        self.aws_secret_access_key = aws_secret_access_key
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+
+        # Bound the requests in flight to the size of the connection pool
+        self.config = AioConfig(max_pool_connections=max_concurrency)
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.session = get_session()
+        self.s3_client = None
+
+    async def __aenter__(self):
+        self.client_context = self.session.create_client('s3', aws_access_key_id=self.aws_access_key_id, aws_secret_access_key=self.aws_secret_access_key, region_name=self.region_name, endpoint_url=self.endpoint_url, config=self.config)
+        self.s3_client = await self.client_context.__aenter__()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.client_context.__aexit__(exc_type, exc_value, traceback)
+        self.s3_client = None
+
+    async def list_buckets(self):
+        # Retrieve the list of existing buckets
+        response = await self.s3_client.list_buckets()
+        return response['Buckets']
+
+    async def upload_fileobj(self, fileobj, bucket, object_name, extra_args=None):
+        """Upload a file to an S3 bucket
+
+        :param fileobj: File stream to upload
+        :param bucket: Bucket to upload to
+        :param object_name: S3 object name.
+        :return: True if file was uploaded, else False
+        """
+
+        if extra_args is None:
+            extra_args = {}
+
+        try:
+            async with self.semaphore:
+                await self.s3_client.put_object(Bucket=bucket, Key=object_name, Body=fileobj, **extra_args)
+        except ClientError as e:
+            logger.error('S3 request failed: %s', e)
+            return False
+        return True
+
+    async def download_fileobj(self, bucket, object_name, fileobj, chunk_size=1024 * 1024):
+        # Stream the object body into fileobj without holding it all in memory
+        async with self.semaphore:
+            response = await self.s3_client.get_object(Bucket=bucket, Key=object_name)
+            async with response['Body'] as stream:
+                chunk = await stream.read(chunk_size)
+                while chunk:
+                    fileobj.write(chunk)
+                    chunk = await stream.read(chunk_size)
+        return True
+
+    async def create_presigned_url(self, bucket_name, object_name, expiration=3600):
+        """Generate a presigned URL to share an S3 object
+
+        :param bucket_name: string
+        :param object_name: string
+        :param expiration: Time in seconds for the presigned URL to remain valid
+        :return: Presigned URL as string. If error, returns None.
+        """
+
+        # Generate a presigned URL for the S3 object
+        try:
+            response = await self.s3_client.generate_presigned_url('get_object',
+                                                                   Params={'Bucket': bucket_name,
+                                                                           'Key': object_name},
+                                                                   ExpiresIn=expiration)
+        except ClientError as e:
+            logger.error('S3 request failed: %s', e)
+            return None
+
+        # The response contains the presigned URL
+        return response
+
+    async def create_presigned_urls(self, items, expiration=3600):
+        """Generate presigned URLs for many S3 objects at once
+
+        :param items: Iterable of (bucket_name, object_name) tuples
+        :param expiration: Time in seconds for the presigned URLs to remain valid
+        :return: List of presigned URLs (None on error) in the order of items
+        """
+
+        return await asyncio.gather(*[self.create_presigned_url(bucket_name, object_name, expiration) for (bucket_name, object_name) in items])